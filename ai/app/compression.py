@@ -0,0 +1,102 @@
+"""Negotiated gzip/brotli response compression"""
+import gzip
+from typing import List, Optional
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+def negotiate_encoding(accept_encoding: str, available: List[str]) -> Optional[str]:
+  """
+  Pick a content encoding from an Accept-Encoding header.
+
+  Args:
+      accept_encoding: Accept-Encoding header value, e.g. "gzip, deflate, br;q=0.9"
+      available: Supported encodings in order of preference
+
+  Returns:
+      Encoding with the highest q-value (ties broken by preference), or None
+  """
+  weights = {}
+  for part in accept_encoding.lower().split(","):
+    name, _, params = part.strip().partition(";")
+    q = 1.0
+    params = params.strip()
+    if params.startswith("q="):
+      try:
+        q = float(params[2:])
+      except ValueError:
+        q = 0.0
+    weights[name.strip()] = q
+
+  best, best_q = None, 0.0
+  for encoding in available:
+    q = weights.get(encoding, weights.get("*", 0.0))
+    if q > best_q:
+      best, best_q = encoding, q
+  return best
+
+
+class CompressionMiddleware:
+  """
+  Compress complete (non-streaming) responses with brotli or gzip.
+
+  The encoding is negotiated from the request's Accept-Encoding header, with
+  brotli preferred. Responses smaller than minimum_size, already
+  encoded, or streamed in several chunks are passed through unchanged.
+  """
+
+  def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 5):
+    self.app = app
+    self.minimum_size = minimum_size
+    self.gzip_level = gzip_level
+    self.brotli_quality = brotli_quality
+    self.available = ["br", "gzip"]
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+    if scope["type"] != "http":
+      await self.app(scope, receive, send)
+      return
+
+    encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""), self.available)
+    if encoding is None:
+      await self.app(scope, receive, send)
+      return
+
+    start_message: Optional[Message] = None
+    passthrough = False
+
+    async def send_compressed(message: Message) -> None:
+      nonlocal start_message, passthrough
+      if message["type"] == "http.response.start":
+        start_message = message
+        passthrough = "content-encoding" in Headers(raw=message["headers"])
+        return
+      if passthrough or message["type"] != "http.response.body" or message.get("more_body", False):
+        # Already encoded, streamed, or not a body (e.g. http.response.pathsend):
+        # forward as-is, after the held start message
+        if start_message is not None:
+          await send(start_message)
+          start_message = None
+        passthrough = True
+        await send(message)
+        return
+
+      body = message.get("body", b"")
+      headers = MutableHeaders(raw=start_message["headers"])
+      if len(body) >= self.minimum_size:
+        body = self.compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+        headers["Content-Length"] = str(len(body))
+        headers.add_vary_header("Accept-Encoding")
+      await send(start_message)
+      start_message = None
+      await send({"type": "http.response.body", "body": body})
+
+    await self.app(scope, receive, send_compressed)
+
+  def compress(self, body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+      return brotli.compress(body, quality=self.brotli_quality)
+    return gzip.compress(body, compresslevel=self.gzip_level)
@@ -1,12 +1,23 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from .compression import CompressionMiddleware
 from .routes import router
+from .services.prompt_index import warm_prompt_index
 
 # TODO: Add Sentry before production
 # from .lib.sentry import init_sentry
 # init_sentry()
 
-app = FastAPI(title="AI Service")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the prompt index in the background; lookups miss until it is ready
+    warm_prompt_index()
+    yield
+
+
+app = FastAPI(title="AI Service", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -17,5 +28,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Negotiated brotli/gzip compression of responses (generated HTML compresses several-fold)
+app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
 app.include_router(router)
 
@@ -1,28 +1,146 @@
 """HTML design generation routes"""
+import os
+import time
+import orjson
 from fastapi import APIRouter
-from ..schemas import HtmlDesignRequest, HtmlDesignResponse, PageDesign
-from ..services.html_design import generate_html_design
+from fastapi.responses import Response
+from ..schemas import HtmlDesignRequest, HtmlDesignResponse
+from ..services.generation_store import get_generation_store
+from ..services.html_diff import diff_pages
+from ..services.html_design import build_reused_conversation, detect_platform, generate_html_design
+from ..services.prompt_index import get_prompt_index, get_reference_threshold, get_reuse_threshold
 
 router = APIRouter()
 
 
+def _generation_store():
+    """Return the generation store, or None when unconfigured or unavailable"""
+    try:
+        return get_generation_store()
+    except Exception as e:
+        # The archive is optional: generate without it while the database is down
+        print(f"Generation store unavailable: {e}")
+        return None
+
+
+def _load_generation(store, generation_id: str):
+    """Load an archived generation, or None when missing or the store fails"""
+    try:
+        return store.get_generation(generation_id)
+    except Exception as e:
+        print(f"Error loading generation {generation_id}: {e}")
+        return None
+
+
+def _json_response(payload) -> Response:
+    """Serialize a response payload with orjson, skipping response_model validation"""
+    return Response(orjson.dumps(payload), media_type="application/json")
+
+
 @router.post("/generate-html-design", response_model=HtmlDesignResponse)
 async def generate_design(req: HtmlDesignRequest):
     """Generate multi-page HTML app design based on prompt with platform detection and conversation history"""
+    started = time.perf_counter()
+    store = _generation_store()
+    index = get_prompt_index() if store is not None else None
+    
+    # Look up the user's previous generations for near-duplicate prompts (new designs only)
+    match = None
+    reference = None
+    platform = req.platform if req.platform in ['mobile', 'web'] else detect_platform(req.prompt)
+    if index is not None and not req.conversation_history:
+        match = index.lookup(req.prompt, platform, get_reference_threshold(), user_id=req.user_id)
+        if match:
+            reference = _load_generation(store, match.generation_id)
+            if reference:
+                print(f"Similar prompt found ({match.similarity:.2f}): {match.prompt}")
+    
+    # Reuse a close match directly when it has the requested number of pages,
+    # unless the request asks for a new design
+    if (
+        reference
+        and req.reuse
+        and match.similarity >= get_reuse_threshold()
+        and len(reference['pages']) == req.num_variations
+    ):
+        index.record_hit(reused=True)
+        pages_list = [{"name": p['name'], "html": p['html']} for p in reference['pages']]
+        conversation = build_reused_conversation(req.prompt, pages_list, platform)
+        generation_id = None
+        try:
+            generation_id = store.record_generation(
+                prompt=req.prompt,
+                platform=platform,
+                pages=pages_list,
+                model=reference['model'],
+                timings={"total_ms": round((time.perf_counter() - started) * 1000, 1)},
+                user_id=req.user_id,
+                conversation_id=req.conversation_id,
+                reused_from=reference['id']
+            )
+            index.add(req.prompt, platform, generation_id, req.user_id)
+        except Exception as e:
+            print(f"Error recording generation: {e}")
+        return _json_response({
+            "pages": pages_list,
+            "count": len(pages_list),
+            "platform": platform,
+            "conversation": conversation,
+            "generation_id": generation_id
+        })
+    if reference:
+        index.record_hit(reused=False)
+    
     pages_list, platform, conversation = generate_html_design(
         prompt=req.prompt,
         num_variations=req.num_variations,
-        platform=req.platform,
-        conversation_history=req.conversation_history
+        platform=platform,
+        conversation_history=req.conversation_history,
+        reference_pages=reference['pages'] if reference else None
     )
+    total_ms = (time.perf_counter() - started) * 1000
     
-    # Convert dict list to PageDesign objects
-    pages = [PageDesign(name=p['name'], html=p['html']) for p in pages_list]
+    # Archive the generation when a store is configured
+    generation_id = None
+    if store and pages_list:
+        try:
+            generation_id = store.record_generation(
+                prompt=req.prompt,
+                platform=platform,
+                pages=pages_list,
+                model=os.getenv("AI_MODEL", "gpt-4o"),
+                timings={"total_ms": round(total_ms, 1)},
+                user_id=req.user_id,
+                conversation_id=req.conversation_id,
+                iteration=bool(req.conversation_history)
+            )
+            if index is not None and not req.conversation_history:
+                index.add(req.prompt, platform, generation_id, req.user_id)
+        except Exception as e:
+            print(f"Error recording generation: {e}")
     
-    return HtmlDesignResponse(
-        pages=pages,
-        count=len(pages),
-        platform=platform,
-        conversation=conversation
-    )
+    # Send changed pages as patches against the previous iteration when requested
+    response_pages = pages_list
+    if req.return_patches and req.previous_generation_id and store:
+        previous = _load_generation(store, req.previous_generation_id)
+        if previous:
+            response_pages = diff_pages(previous['pages'], pages_list)
+    
+    # Service output already matches HtmlDesignResponse: serialize it directly,
+    # skipping response_model validation (the model still documents the schema)
+    return _json_response({
+        "pages": response_pages,
+        "count": len(response_pages),
+        "platform": platform,
+        "conversation": conversation,
+        "generation_id": generation_id
+    })
+
 
+@router.get("/prompt-index/stats")
+async def prompt_index_stats():
+    """Size and hit rate of the near-duplicate prompt index"""
+    index = get_prompt_index()
+    if index is None:
+        return {"enabled": False}
+    return {"enabled": True, **index.stats()}
@@ -7,11 +7,17 @@ class HtmlDesignRequest(BaseModel):
   num_variations: int = 3
   platform: Optional[str] = None  # 'mobile' or 'web', auto-detected if None
   conversation_history: Optional[List[Dict[str, Any]]] = None  # For iterations
+  user_id: Optional[str] = None  # Owner, used to index archived generations
+  conversation_id: Optional[str] = None  # Groups iterations in the archive
+  previous_generation_id: Optional[str] = None  # Generation this iteration updates
+  return_patches: bool = False  # Return patches against previous_generation_id pages
+  reuse: bool = True  # Return a previous generation for a near-identical prompt; False always generates
 
 
 class PageDesign(BaseModel):
   name: str  # "Home", "Detail", "Settings", etc.
-  html: str  # Complete HTML for this page
+  html: Optional[str] = None  # Complete HTML for this page, unless patch is set
+  patch: Optional[List[Dict[str, Any]]] = None  # Ops against the previous page (services/html_diff.py)
 
 
 class HtmlDesignResponse(BaseModel):
@@ -19,4 +25,5 @@ class HtmlDesignResponse(BaseModel):
   count: int
   platform: str  # Detected or provided platform
   conversation: List[Dict[str, Any]]  # Full conversation including current exchange
+  generation_id: Optional[str] = None  # Archive id, set when a generation store is configured
 
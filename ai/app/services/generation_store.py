@@ -0,0 +1,390 @@
+"""Content-addressed archive of HTML design generations (Postgres or SQLite)"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+COMPRESSION_LEVEL = 6
+CONNECT_TIMEOUT_SECONDS = 3
+RETRY_SECONDS = 30  # Wait before reconnecting to an unavailable database
+
+
+def page_hash(html: str) -> str:
+  """Return the content address (hex SHA-256) of a page's HTML."""
+  return hashlib.sha256(html.encode("utf-8")).hexdigest()
+
+
+def compress_html(html: str) -> bytes:
+  return zlib.compress(html.encode("utf-8"), COMPRESSION_LEVEL)
+
+
+def decompress_html(data: bytes) -> str:
+  return zlib.decompress(bytes(data)).decode("utf-8")
+
+
+class GenerationStore:
+  """
+  Backend-agnostic generation archive.
+
+  Subclasses provide a connection context manager and their SQL dialect
+  details (parameter placeholder, binary column type). Queries are written
+  with "?" placeholders and rewritten for the backend.
+  """
+
+  placeholder = "?"
+  blob_type = "BLOB"
+  time_type = "REAL"
+
+  def _connect(self):
+    raise NotImplementedError
+
+  def _sql(self, sql: str) -> str:
+    return sql if self.placeholder == "?" else sql.replace("?", self.placeholder)
+
+  def _schema(self) -> List[str]:
+    return [
+      f"""CREATE TABLE IF NOT EXISTS page_blobs (
+        hash TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        compressed_size INTEGER NOT NULL,
+        data {self.blob_type} NOT NULL,
+        created_at {self.time_type} NOT NULL
+      )""",
+      f"""CREATE TABLE IF NOT EXISTS generations (
+        id TEXT PRIMARY KEY,
+        user_id TEXT,
+        conversation_id TEXT,
+        prompt TEXT NOT NULL,
+        platform TEXT NOT NULL,
+        model TEXT,
+        timings TEXT NOT NULL,
+        iteration BOOLEAN NOT NULL DEFAULT FALSE,
+        reused_from TEXT,
+        created_at {self.time_type} NOT NULL
+      )""",
+      """CREATE TABLE IF NOT EXISTS generation_pages (
+        generation_id TEXT NOT NULL REFERENCES generations(id) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        page_hash TEXT NOT NULL REFERENCES page_blobs(hash),
+        PRIMARY KEY (generation_id, position)
+      )""",
+      "CREATE INDEX IF NOT EXISTS generations_user_idx ON generations (user_id, created_at)",
+      "CREATE INDEX IF NOT EXISTS generations_conversation_idx ON generations (conversation_id, created_at)",
+      "CREATE INDEX IF NOT EXISTS generations_created_idx ON generations (created_at)",
+      "CREATE INDEX IF NOT EXISTS generation_pages_hash_idx ON generation_pages (page_hash)",
+    ]
+
+  def init_schema(self) -> None:
+    with self._connect() as conn:
+      for statement in self._schema():
+        conn.execute(statement)
+
+  def record_generation(
+    self,
+    prompt: str,
+    platform: str,
+    pages: List[Dict[str, str]],
+    model: Optional[str] = None,
+    timings: Optional[Dict[str, float]] = None,
+    user_id: Optional[str] = None,
+    conversation_id: Optional[str] = None,
+    iteration: bool = False,
+    reused_from: Optional[str] = None,
+  ) -> str:
+    """
+    Store a generation and its pages.
+
+    Args:
+        prompt: User prompt that produced the generation
+        platform: 'mobile' or 'web'
+        pages: [{"name": "Home", "html": "..."}, ...]
+        model: LLM model identifier
+        timings: Timing measurements in milliseconds, e.g. {"total_ms": 5120.4}
+        user_id: Owner of the generation
+        conversation_id: Conversation the generation belongs to
+        iteration: Whether the generation refined a previous one in the conversation
+        reused_from: Id of the generation whose pages were reused for a similar prompt
+
+    Returns:
+        The new generation id
+    """
+    generation_id = uuid.uuid4().hex
+    now = time.time()
+
+    blobs = {}
+    page_rows = []
+    for position, page in enumerate(pages):
+      digest = page_hash(page["html"])
+      if digest not in blobs:
+        blobs[digest] = page["html"]
+      page_rows.append((generation_id, position, page["name"], digest))
+
+    with self._connect() as conn:
+      conn.execute(
+        self._sql(
+          "INSERT INTO generations "
+          "(id, user_id, conversation_id, prompt, platform, model, timings, iteration, reused_from, created_at) "
+          "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        ),
+        (
+          generation_id, user_id, conversation_id, prompt, platform, model,
+          json.dumps(timings or {}), iteration, reused_from, now,
+        ),
+      )
+      for digest, html in blobs.items():
+        data = compress_html(html)
+        conn.execute(
+          self._sql(
+            "INSERT INTO page_blobs (hash, size, compressed_size, data, created_at) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT (hash) DO NOTHING"
+          ),
+          (digest, len(html.encode("utf-8")), len(data), data, now),
+        )
+      for row in page_rows:
+        conn.execute(
+          self._sql(
+            "INSERT INTO generation_pages (generation_id, position, name, page_hash) VALUES (?, ?, ?, ?)"
+          ),
+          row,
+        )
+
+    return generation_id
+
+  def get_generation(self, generation_id: str, include_html: bool = True) -> Optional[Dict[str, Any]]:
+    """Return a generation with its pages, or None if it does not exist."""
+    with self._connect() as conn:
+      row = conn.execute(
+        self._sql(
+          "SELECT id, user_id, conversation_id, prompt, platform, model, timings, created_at, reused_from "
+          "FROM generations WHERE id = ?"
+        ),
+        (generation_id,),
+      ).fetchone()
+      if row is None:
+        return None
+      generation = self._row_to_generation(row)
+      generation["pages"] = self._load_pages(conn, [generation_id], include_html)[generation_id]
+    return generation
+
+  def list_generations(
+    self,
+    user_id: Optional[str] = None,
+    conversation_id: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    limit: int = 50,
+    include_html: bool = False,
+  ) -> List[Dict[str, Any]]:
+    """
+    List generations, newest first, filtered by user, conversation and time.
+
+    Args:
+        user_id: Only generations of this user
+        conversation_id: Only generations of this conversation
+        since: Only generations created at or after this unix timestamp
+        until: Only generations created before this unix timestamp
+        limit: Maximum number of generations to return
+        include_html: Decompress and include page HTML (names and hashes otherwise)
+
+    Returns:
+        List of generation dicts with their pages
+    """
+    clauses = []
+    params: List[Any] = []
+    if user_id is not None:
+      clauses.append("user_id = ?")
+      params.append(user_id)
+    if conversation_id is not None:
+      clauses.append("conversation_id = ?")
+      params.append(conversation_id)
+    if since is not None:
+      clauses.append("created_at >= ?")
+      params.append(since)
+    if until is not None:
+      clauses.append("created_at < ?")
+      params.append(until)
+    where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+    params.append(limit)
+
+    with self._connect() as conn:
+      rows = conn.execute(
+        self._sql(
+          "SELECT id, user_id, conversation_id, prompt, platform, model, timings, created_at, reused_from "
+          f"FROM generations {where}ORDER BY created_at DESC LIMIT ?"
+        ),
+        tuple(params),
+      ).fetchall()
+      generations = [self._row_to_generation(row) for row in rows]
+      pages = self._load_pages(conn, [g["id"] for g in generations], include_html)
+    for generation in generations:
+      generation["pages"] = pages[generation["id"]]
+    return generations
+
+  def list_prompts(self, limit: int) -> List[Tuple[str, str, str, Optional[str]]]:
+    """Return (id, prompt, platform, user_id) of the newest non-iteration generations."""
+    with self._connect() as conn:
+      rows = conn.execute(
+        self._sql(
+          "SELECT id, prompt, platform, user_id FROM generations WHERE NOT iteration "
+          "ORDER BY created_at DESC LIMIT ?"
+        ),
+        (limit,),
+      ).fetchall()
+    return [(row[0], row[1], row[2], row[3]) for row in rows]
+
+  def get_page_html(self, digest: str) -> Optional[str]:
+    """Return the HTML stored under a content address."""
+    with self._connect() as conn:
+      row = conn.execute(self._sql("SELECT data FROM page_blobs WHERE hash = ?"), (digest,)).fetchone()
+    return decompress_html(row[0]) if row else None
+
+  def _row_to_generation(self, row) -> Dict[str, Any]:
+    return {
+      "id": row[0],
+      "user_id": row[1],
+      "conversation_id": row[2],
+      "prompt": row[3],
+      "platform": row[4],
+      "model": row[5],
+      "timings": json.loads(row[6]),
+      "created_at": row[7],
+      "reused_from": row[8],
+    }
+
+  def _load_pages(self, conn, generation_ids: List[str], include_html: bool) -> Dict[str, List[Dict[str, Any]]]:
+    pages: Dict[str, List[Dict[str, Any]]] = {generation_id: [] for generation_id in generation_ids}
+    if not generation_ids:
+      return pages
+
+    marks = ", ".join("?" for _ in generation_ids)
+    data_column = "b.data" if include_html else "NULL"
+    rows = conn.execute(
+      self._sql(
+        f"SELECT p.generation_id, p.name, p.page_hash, b.size, {data_column} "
+        "FROM generation_pages p JOIN page_blobs b ON b.hash = p.page_hash "
+        f"WHERE p.generation_id IN ({marks}) ORDER BY p.generation_id, p.position"
+      ),
+      tuple(generation_ids),
+    ).fetchall()
+
+    for generation_id, name, digest, size, data in rows:
+      page = {"name": name, "hash": digest, "size": size}
+      if include_html:
+        page["html"] = decompress_html(data)
+      pages[generation_id].append(page)
+    return pages
+
+
+class SqliteGenerationStore(GenerationStore):
+  """SQLite backend, suitable for local development and tests."""
+
+  def __init__(self, path: str = ":memory:"):
+    if path != ":memory:":
+      os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    self._conn = sqlite3.connect(path, check_same_thread=False)
+    self._conn.execute("PRAGMA foreign_keys = ON")
+    self._conn.execute("PRAGMA journal_mode = WAL")
+    self._lock = threading.Lock()
+    self.init_schema()
+
+  @contextmanager
+  def _connect(self) -> Iterator[sqlite3.Connection]:
+    # Connection context manager commits on success and rolls back on error
+    with self._lock, self._conn:
+      yield self._conn
+
+  def close(self) -> None:
+    self._conn.close()
+
+
+class PostgresGenerationStore(GenerationStore):
+  """Postgres backend using psycopg."""
+
+  placeholder = "%s"
+  blob_type = "BYTEA"
+  time_type = "DOUBLE PRECISION"
+
+  def __init__(self, dsn: str):
+    import psycopg
+
+    self._psycopg = psycopg
+    self._dsn = dsn
+    self._conn = None
+    self._retry_at = 0.0
+    self._lock = threading.Lock()
+    self.init_schema()
+
+  @contextmanager
+  def _connect(self):
+    # One connection per store, shared behind a lock like the SQLite backend.
+    # Each operation runs in its own transaction; a broken connection is
+    # dropped and reopened by a later operation, at most every RETRY_SECONDS
+    # so that requests fail fast while the database is down.
+    with self._lock:
+      if self._conn is None or self._conn.closed:
+        if time.monotonic() < self._retry_at:
+          raise self._psycopg.OperationalError("Generation database unavailable, waiting to reconnect")
+        try:
+          self._conn = self._psycopg.connect(
+            self._dsn, autocommit=True, connect_timeout=CONNECT_TIMEOUT_SECONDS
+          )
+        except self._psycopg.OperationalError:
+          self._retry_at = time.monotonic() + RETRY_SECONDS
+          raise
+      try:
+        with self._conn.transaction():
+          yield self._conn
+      except self._psycopg.OperationalError:
+        self._conn.close()
+        raise
+
+  def close(self) -> None:
+    with self._lock:
+      if self._conn is not None:
+        self._conn.close()
+
+
+def create_generation_store(url: str) -> GenerationStore:
+  """Create a store from a database URL (postgres:// or sqlite:///path)."""
+  if url.startswith(("postgres://", "postgresql://")):
+    return PostgresGenerationStore(url)
+  if url.startswith("sqlite://"):
+    # sqlite:///relative/path.db or sqlite:////absolute/path.db
+    path = url[len("sqlite:///"):]
+    return SqliteGenerationStore(path or ":memory:")
+  raise ValueError(f"Unsupported generation store URL: {url}")
+
+
+_store: Optional[GenerationStore] = None
+_store_retry_at = 0.0
+_store_lock = threading.Lock()
+
+
+def get_generation_store() -> Optional[GenerationStore]:
+  """
+  Return the configured store, or None when GENERATION_DB_URL is unset.
+
+  Raises when the store cannot be created; after a failure, raises without
+  retrying for RETRY_SECONDS.
+  """
+  global _store, _store_retry_at
+  url = os.getenv("GENERATION_DB_URL")
+  if not url:
+    return None
+  with _store_lock:
+    if _store is None:
+      if time.monotonic() < _store_retry_at:
+        raise RuntimeError("Generation store unavailable, waiting to retry")
+      try:
+        _store = create_generation_store(url)
+      except Exception:
+        _store_retry_at = time.monotonic() + RETRY_SECONDS
+        raise
+    return _store
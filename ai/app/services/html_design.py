@@ -6,6 +6,9 @@ from typing import List, Optional, Dict, Any, Tuple
 from litellm import completion
 from .html_design_prompt import get_design_system_prompt
 
+# Reference design HTML passed to the LLM is truncated to bound prompt size
+REFERENCE_HTML_CHARS = 6000
+
 
 def detect_platform(prompt: str) -> str:
     """
@@ -82,11 +85,52 @@ Format as a brief paragraph."""
         return f"Design features a {platform} interface with modern styling and user-friendly layout."
 
 
+def build_reference_prompt(reference_pages: List[Dict[str, str]]) -> str:
+    """
+    Describe a previous generation for a similar prompt as a reference design.
+    
+    Args:
+        reference_pages: [{"name": "Home", "html": "..."}, ...]
+        
+    Returns:
+        Prompt section with the page names and the first page's HTML
+    """
+    page_names = ", ".join([p['name'] for p in reference_pages])
+    return f"""A similar request was previously designed with these pages: {page_names}.
+Use it as a reference design: adapt and reuse its structure and styling where it fits this request.
+
+Reference HTML of the "{reference_pages[0]['name']}" page (first {REFERENCE_HTML_CHARS} chars):
+{reference_pages[0]['html'][:REFERENCE_HTML_CHARS]}"""
+
+
+def build_reused_conversation(prompt: str, pages: List[Dict[str, str]], platform: str) -> List[Dict[str, Any]]:
+    """
+    Build the conversation for a design reused from a previous generation.
+    
+    Args:
+        prompt: User's design requirements
+        pages: Reused pages [{"name": "Home", "html": "..."}, ...]
+        platform: 'mobile' or 'web'
+        
+    Returns:
+        Conversation with the user prompt and an assistant reply, for later iterations
+    """
+    page_names = ", ".join([p['name'] for p in pages])
+    return [
+        {"role": "user", "content": prompt},
+        {
+            "role": "assistant",
+            "content": f"I've generated {len(pages)} pages for your {platform} app: {page_names}."
+        }
+    ]
+
+
 def generate_html_design(
     prompt: str, 
     num_variations: int = 3,
     platform: Optional[str] = None,
-    conversation_history: Optional[List[Dict[str, Any]]] = None
+    conversation_history: Optional[List[Dict[str, Any]]] = None,
+    reference_pages: Optional[List[Dict[str, str]]] = None
 ) -> Tuple[List[Dict[str, str]], str, List[Dict[str, Any]]]:
     """
     Generate multi-page HTML app design based on prompt.
@@ -96,6 +140,8 @@ def generate_html_design(
         num_variations: Number of pages to generate (default: 3)
         platform: 'mobile' or 'web', auto-detected if None
         conversation_history: Previous conversation for iterations
+        reference_pages: Pages of a previous generation for a similar prompt,
+            used as a starting point for new (non-iteration) designs
         
     Returns:
         Tuple of (pages_list, detected_platform, full_conversation)
@@ -125,6 +171,12 @@ def generate_html_design(
     
     messages.append({"role": "user", "content": user_prompt})
     
+    # The returned conversation excludes the reference design, which comes
+    # from another generation and is only meant for this request
+    conversation_messages = messages[1:]
+    if reference_pages and not conversation_history:
+        messages[-1] = {"role": "user", "content": f"{user_prompt}\n\n{build_reference_prompt(reference_pages)}"}
+    
     print(f"Generating {num_variations} pages for {detected_platform} app")
     
     try:
@@ -189,7 +241,7 @@ def generate_html_design(
     # If no pages generated, return empty
     if not pages:
         print("No pages generated, returning empty list")
-        full_conversation = messages[1:] if len(messages) > 1 else []
+        full_conversation = list(conversation_messages)
         full_conversation.append({"role": "user", "content": prompt})
         return [], detected_platform, full_conversation
     
@@ -197,7 +249,7 @@ def generate_html_design(
     design_summary = extract_design_summary(pages[0]['html'], detected_platform)
     
     # Build full conversation for next iteration
-    full_conversation = messages[1:] if len(messages) > 1 else []  # Exclude system prompt
+    full_conversation = list(conversation_messages)  # Excludes system prompt
     full_conversation.append({"role": "user", "content": prompt})
     
     # Add design summary as assistant response (for LLM memory)
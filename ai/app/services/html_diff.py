@@ -0,0 +1,391 @@
+"""Structural HTML diffs between page iterations, addressed by browser DOM paths"""
+# ruff: noqa: N802, N803 (html5lib tree builder API is camelCase)
+import difflib
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+import html5lib
+from html5lib.constants import namespaces
+from html5lib.treebuilders import base as treebuilder_base
+
+VOID_ELEMENTS = {
+  "area", "base", "basefont", "bgsound", "br", "col", "embed", "frame", "hr", "img", "input",
+  "keygen", "link", "meta", "param", "source", "track", "wbr",
+}
+
+# Elements whose text content is not escaped; <noscript> is raw text because
+# pages are shown in iframes with scripts enabled
+RAW_TEXT_ELEMENTS = {"iframe", "noembed", "noframes", "noscript", "plaintext", "script", "style", "xmp"}
+
+# Elements whose first newline is dropped by the parser
+LEADING_NEWLINE_ELEMENTS = {"listing", "pre", "textarea"}
+
+# Foreign content roots, used to parse fragments inside SVG and MathML
+_FOREIGN_ROOTS = {namespaces["svg"]: "svg", namespaces["mathml"]: "math"}
+
+# Fixed JSON overhead of an operation, used to compare patch and document sizes
+_OP_OVERHEAD = 32
+
+
+class Node(treebuilder_base.Node):
+  """Node of a parsed HTML document, built by html5lib's tree construction."""
+
+  def __init__(self, kind: str, name: str = "", namespace: Optional[str] = None, value: str = ""):
+    super().__init__(name)
+    self.kind = kind  # "element", "text", "comment", "doctype", "document" or "fragment"
+    self.namespace = namespace  # None for HTML elements
+    self.value = value
+
+  @property
+  def attributes(self) -> Dict[str, str]:
+    return self._attributes
+
+  @attributes.setter
+  def attributes(self, attributes: Dict[Any, str]) -> None:
+    # Foreign attributes such as xlink:href come as (prefix, name, namespace)
+    self._attributes = {
+      (f"{name[0]}:{name[1]}" if name[0] else name[1]) if isinstance(name, tuple) else name: value
+      for name, value in attributes.items()
+    }
+
+  @property
+  def nameTuple(self) -> Tuple[str, str]:
+    return (self.namespace or namespaces["html"], self.name)
+
+  def key(self) -> Tuple[str, str, Optional[str]]:
+    """Alignment key of the node among its siblings."""
+    if self.kind == "element":
+      return (self.kind, self.name, self.attributes.get("id"))
+    return (self.kind, "", None)
+
+  def appendChild(self, node: "Node") -> None:
+    node.parent = self
+    self.childNodes.append(node)
+
+  def insertText(self, data: str, insertBefore: Optional["Node"] = None) -> None:
+    # Adjacent text is merged into one node, like the DOM parser does
+    index = len(self.childNodes) if insertBefore is None else self.childNodes.index(insertBefore)
+    if index and self.childNodes[index - 1].kind == "text":
+      self.childNodes[index - 1].value += data
+    else:
+      text = Node("text", value=data)
+      text.parent = self
+      self.childNodes.insert(index, text)
+
+  def insertBefore(self, node: "Node", refNode: "Node") -> None:
+    node.parent = self
+    self.childNodes.insert(self.childNodes.index(refNode), node)
+
+  def removeChild(self, node: "Node") -> None:
+    self.childNodes.remove(node)
+    node.parent = None
+
+  def cloneNode(self) -> "Node":
+    node = Node(self.kind, self.name, self.namespace, self.value)
+    node.attributes = dict(self.attributes)
+    return node
+
+  def hasContent(self) -> bool:
+    return bool(self.childNodes)
+
+
+class _TreeBuilder(treebuilder_base.TreeBuilder):
+  """html5lib tree builder producing Node trees."""
+
+  def documentClass(self) -> Node:
+    return Node("document")
+
+  def fragmentClass(self) -> Node:
+    return Node("fragment")
+
+  def elementClass(self, name: str, namespace: Optional[str] = None) -> Node:
+    return Node("element", name, namespace)
+
+  def commentClass(self, data: str) -> Node:
+    return Node("comment", value=data)
+
+  def doctypeClass(self, name: str, public_id: Optional[str], system_id: Optional[str]) -> Node:
+    return Node("doctype", name or "")
+
+
+def _parser() -> html5lib.HTMLParser:
+  return html5lib.HTMLParser(tree=_TreeBuilder, namespaceHTMLElements=False)
+
+
+def parse_html(html: str) -> Node:
+  """Parse an HTML page into the document tree a browser builds."""
+  return _parser().parse(html, scripting=True)
+
+
+def _escape_text(text: str) -> str:
+  return text.replace("&", "&amp;").replace("\xa0", "&nbsp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _escape_attribute(value: str) -> str:
+  return value.replace("&", "&amp;").replace("\xa0", "&nbsp;").replace('"', "&quot;")
+
+
+def _start_tag(node: Node) -> str:
+  attributes = "".join(f' {name}="{_escape_attribute(value)}"' for name, value in node.attributes.items())
+  return f"<{node.name}{attributes}>"
+
+
+def _raw_text(node: Node) -> bool:
+  return node.namespace is None and node.name in RAW_TEXT_ELEMENTS
+
+
+def serialize(node: Node, raw_text: bool = False) -> str:
+  """Serialize a node tree following the HTML fragment serialization algorithm."""
+  if node.kind == "text":
+    return node.value if raw_text else _escape_text(node.value)
+  if node.kind == "comment":
+    return f"<!--{node.value}-->"
+  if node.kind == "doctype":
+    return f"<!DOCTYPE {node.name}>"
+  return _wrap(node, "".join(serialize(child, _raw_text(node)) for child in node.childNodes))
+
+
+def _wrap(node: Node, inner: str) -> str:
+  if node.kind != "element":
+    return inner
+  if node.namespace is None:
+    if node.name in VOID_ELEMENTS:
+      return _start_tag(node)
+    if node.name in LEADING_NEWLINE_ELEMENTS and inner.startswith("\n"):
+      inner = "\n" + inner  # The parser drops the first newline
+  return f"{_start_tag(node)}{inner}</{node.name}>"
+
+
+def canonicalize_html(html: str) -> str:
+  """Return the canonical serialization that patches reproduce."""
+  return serialize(parse_html(html))
+
+
+def _op_node(op: Dict[str, Any], parent: Node) -> Node:
+  """Parse the node carried by a replace or insert operation in its parent's context."""
+  if "text" in op:
+    return Node("text", value=op["text"])
+  html = op["html"]
+  if parent.kind == "document":
+    # Doctype or comment outside <html>
+    children = [child for child in parse_html(html).childNodes if child.kind != "element"]
+  elif parent.namespace in _FOREIGN_ROOTS:
+    root = _FOREIGN_ROOTS[parent.namespace]
+    children = _parser().parseFragment(f"<{root}>{html}</{root}>", scripting=True).childNodes[0].childNodes
+  else:
+    children = _parser().parseFragment(html, container=parent.name, scripting=True).childNodes
+  if len(children) != 1:
+    raise ValueError(f"Patch fragment must contain exactly one node: {html[:80]!r}")
+  return children[0]
+
+
+class _Differ:
+  def __init__(self):
+    self._html: Dict[int, str] = {}
+
+  def html(self, node: Node, raw_text: bool = False) -> str:
+    # Memoized serialization, built from the children's; the trees are not
+    # modified while diffing
+    cached = self._html.get(id(node))
+    if cached is None:
+      if node.kind == "element":
+        raw_children = _raw_text(node)
+        cached = _wrap(node, "".join(self.html(child, raw_children) for child in node.childNodes))
+      else:
+        cached = serialize(node, raw_text)
+      self._html[id(node)] = cached
+    return cached
+
+  def node_op(self, op: str, node: Node, path: List[int]) -> Dict[str, Any]:
+    """Build a replace or insert operation carrying the node."""
+    if node.kind == "text":
+      return {"op": op, "path": path, "text": node.value}
+    return {"op": op, "path": path, "html": self.html(node)}
+
+  def diff_attrs(self, old: Node, new: Node, path: List[int]) -> Dict[str, Any]:
+    """
+    Build the attrs operation for an element.
+
+    Removed attributes are applied before set ones, and set attributes go last,
+    so when kept attributes change order the ones from the first moved on are
+    removed and set again.
+    """
+    old_attrs, new_attrs = old.attributes, new.attributes
+    kept = [name for name in old_attrs if name in new_attrs]
+    in_place = 0
+    for old_name, new_name in zip(kept, new_attrs, strict=False):
+      if old_name != new_name:
+        break
+      in_place += 1
+    moved = set(list(new_attrs)[in_place:])
+    return {
+      "op": "attrs",
+      "path": path,
+      "set": {
+        name: value for name, value in new_attrs.items()
+        if name in moved or old_attrs[name] != value
+      },
+      "remove": [name for name in old_attrs if name not in new_attrs or name in moved],
+    }
+
+  def check_fragment(self, op: Dict[str, Any], parent: Node) -> Dict[str, Any]:
+    """Check that the markup of an operation parses back to its node in the parent."""
+    if "html" in op and serialize(_op_node(op, parent)) != op["html"]:
+      # Parser error recovery (e.g. a <form> nested by the DOM) cannot be reproduced
+      raise ValueError(f"Markup at {op['path']} does not parse back to the same node")
+    return op
+
+  def diff_node(self, old: Node, new: Node, path: List[int], parent: Node) -> List[Dict[str, Any]]:
+    if self.html(old) == self.html(new):
+      return []
+    if old.kind == "text" and new.kind == "text":
+      return [{"op": "text", "path": path, "text": new.value}]
+
+    replace = self.node_op("replace", new, path)
+    if old.kind == "element" and (old.name, old.namespace) == (new.name, new.namespace):
+      ops = []
+      if list(old.attributes.items()) != list(new.attributes.items()):
+        ops.append(self.diff_attrs(old, new, path))
+      ops.extend(self.diff_children(old, new.childNodes, path))
+      # <html>, <head> and <body> cannot be replaced in a live DOM
+      if new.name in ("html", "head", "body") or _ops_size(ops) < _ops_size([replace]):
+        return ops
+    return [self.check_fragment(replace, parent)]
+
+  def diff_children(self, parent: Node, new: List[Node], path: List[int]) -> List[Dict[str, Any]]:
+    """Diff the children of an old node against a new node's children."""
+    old = parent.childNodes
+    matcher = difflib.SequenceMatcher(
+      None, [child.key() for child in old], [child.key() for child in new], autojunk=False
+    )
+    ops: List[Dict[str, Any]] = []
+    # Right to left, so indexes left of the current block still match the old list
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+      if tag == "equal":
+        for offset in range(i2 - i1 - 1, -1, -1):
+          ops.extend(self.diff_node(old[i1 + offset], new[j1 + offset], path + [i1 + offset], parent))
+        continue
+
+      paired = min(i2 - i1, j2 - j1)
+      for index in range(i2 - 1, i1 + paired - 1, -1):
+        ops.append({"op": "remove", "path": path + [index]})
+      for offset in range(paired, j2 - j1):
+        ops.append(self.check_fragment(self.node_op("insert", new[j1 + offset], path + [i1 + offset]), parent))
+      for offset in range(paired - 1, -1, -1):
+        ops.extend(self.diff_node(old[i1 + offset], new[j1 + offset], path + [i1 + offset], parent))
+    return ops
+
+
+def _ops_size(ops: List[Dict[str, Any]]) -> int:
+  size = 0
+  for op in ops:
+    size += _OP_OVERHEAD + 4 * len(op["path"])
+    size += len(op.get("html", "")) + len(op.get("text", ""))
+    if op["op"] == "attrs":
+      size += len(json.dumps(op["set"])) + len(json.dumps(op["remove"]))
+  return size
+
+
+def diff_html(old_html: str, new_html: str) -> List[Dict[str, Any]]:
+  """
+  Compute patch operations turning one HTML document into another.
+
+  Operations address nodes by their path of child indexes from the document
+  (document.childNodes of the page's iframe), each path referring to the
+  document as left by the previous operations:
+
+      {"op": "text", "path": [1, 2, 3, 0], "text": "Save"}
+      {"op": "attrs", "path": [1, 2, 3], "set": {"class": "btn"}, "remove": ["disabled"]}
+      {"op": "replace", "path": [1, 2, 4], "html": "<p>New</p>"}
+      {"op": "insert", "path": [1, 2, 5], "html": "<li>Item</li>"}
+      {"op": "remove", "path": [1, 2, 6]}
+
+  "html" is parsed in the context of the parent element (as by
+  insertAdjacentHTML), or as a document for the doctype and comments outside
+  <html>; replace and insert carry "text" for text nodes, values are decoded,
+  and attrs removes before it sets.
+
+  Args:
+      old_html: Previous version of the page
+      new_html: New version of the page
+
+  Returns:
+      List of patch operations (empty when the documents are equivalent)
+
+  Raises:
+      ValueError: When changed markup would not parse back to the same nodes
+  """
+  old_root, new_root = parse_html(old_html), parse_html(new_html)
+  return _Differ().diff_children(old_root, new_root.childNodes, [])
+
+
+def apply_patch(html: str, ops: List[Dict[str, Any]]) -> str:
+  """
+  Reference implementation of patch application.
+
+  Args:
+      html: Previous version of the page
+      ops: Patch operations from diff_html
+
+  Returns:
+      New version of the page, in canonical serialization
+  """
+  root = parse_html(html)
+  for op in ops:
+    *parent_path, index = op["path"]
+    parent = root
+    for step in parent_path:
+      parent = parent.childNodes[step]
+
+    if op["op"] == "insert":
+      node = _op_node(op, parent)
+      if index < len(parent.childNodes):
+        parent.insertBefore(node, parent.childNodes[index])
+      else:
+        parent.appendChild(node)
+    elif op["op"] == "remove":
+      parent.removeChild(parent.childNodes[index])
+    elif op["op"] == "replace":
+      node = _op_node(op, parent)
+      node.parent = parent
+      parent.childNodes[index] = node
+    elif op["op"] == "text":
+      parent.childNodes[index].value = op["text"]
+    elif op["op"] == "attrs":
+      node = parent.childNodes[index]
+      attributes = {name: value for name, value in node.attributes.items() if name not in op["remove"]}
+      attributes.update(op["set"])
+      node.attributes = attributes
+    else:
+      raise ValueError(f"Unknown patch operation: {op['op']}")
+  return serialize(root)
+
+
+def diff_pages(
+  previous_pages: List[Dict[str, str]], pages: List[Dict[str, str]]
+) -> List[Dict[str, Any]]:
+  """
+  Diff each page against the previous version of the same name.
+
+  Args:
+      previous_pages: Pages of the previous iteration [{"name": "Home", "html": "..."}, ...]
+      pages: Pages of the new iteration
+
+  Returns:
+      Pages in new order, as {"name", "patch"} when a previous version exists and
+      the patch is smaller than the document, {"name", "html"} otherwise
+  """
+  previous = {page["name"]: page["html"] for page in previous_pages}
+  result = []
+  for page in pages:
+    if page["name"] in previous:
+      try:
+        ops = diff_html(previous[page["name"]], page["html"])
+      except ValueError as e:
+        print(f"Error diffing page {page['name']}: {e}")
+        ops = None
+      if ops is not None and _ops_size(ops) < len(page["html"]):
+        result.append({"name": page["name"], "patch": ops})
+        continue
+    result.append({"name": page["name"], "html": page["html"]})
+  return result
@@ -0,0 +1,124 @@
+import asyncio
+import gzip
+
+import brotli
+import pytest
+
+from app.compression import CompressionMiddleware, negotiate_encoding
+
+BODY = b"<div class='card'>Card</div>" * 100
+
+
+@pytest.mark.parametrize(
+  "accept_encoding, expected",
+  [
+    ("gzip, deflate, br", "br"),
+    ("gzip", "gzip"),
+    ("br;q=0.5, gzip;q=0.8", "gzip"),
+    ("br;q=0, gzip", "gzip"),
+    ("br;q=0, gzip;q=0", None),
+    ("*", "br"),
+    ("br;q=0, *", "gzip"),
+    ("*;q=0", None),
+    ("deflate, identity", None),
+    ("", None),
+    ("GZIP; q=0.3", "gzip"),
+    ("br;q=oops, gzip", "gzip"),
+  ],
+)
+def test_negotiate_encoding(accept_encoding, expected):
+  assert negotiate_encoding(accept_encoding, ["br", "gzip"]) == expected
+
+
+def make_app(*messages):
+  async def app(scope, receive, send):
+    for message in messages:
+      await send(message)
+
+  return app
+
+
+def start(headers=()):
+  return {"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/html"), *headers]}
+
+
+def body(data, more_body=False):
+  return {"type": "http.response.body", "body": data, "more_body": more_body}
+
+
+def run(app, accept_encoding="gzip, br", minimum_size=1024):
+  sent = []
+
+  async def send(message):
+    sent.append(message)
+
+  async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+  scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+  asyncio.run(CompressionMiddleware(app, minimum_size=minimum_size)(scope, receive, send))
+  return sent
+
+
+def headers_of(message):
+  return {name.decode(): value.decode() for name, value in message["headers"]}
+
+
+def test_compresses_with_brotli_and_sets_headers():
+  sent = run(make_app(start([(b"content-length", str(len(BODY)).encode())]), body(BODY)))
+
+  headers = headers_of(sent[0])
+  assert headers["content-encoding"] == "br"
+  assert headers["vary"] == "Accept-Encoding"
+  assert int(headers["content-length"]) == len(sent[1]["body"]) < len(BODY)
+  assert brotli.decompress(sent[1]["body"]) == BODY
+
+
+def test_compresses_with_gzip():
+  sent = run(make_app(start(), body(BODY)), accept_encoding="gzip")
+
+  assert headers_of(sent[0])["content-encoding"] == "gzip"
+  assert gzip.decompress(sent[1]["body"]) == BODY
+
+
+def test_keeps_existing_vary_header():
+  sent = run(make_app(start([(b"vary", b"Origin")]), body(BODY)))
+
+  assert headers_of(sent[0])["vary"] == "Origin, Accept-Encoding"
+
+
+def test_small_responses_are_not_compressed():
+  sent = run(make_app(start(), body(BODY[:100])), minimum_size=1024)
+
+  assert "content-encoding" not in headers_of(sent[0])
+  assert sent[1]["body"] == BODY[:100]
+
+
+def test_without_accepted_encoding_passes_through():
+  sent = run(make_app(start(), body(BODY)), accept_encoding="br;q=0, gzip;q=0")
+
+  assert "content-encoding" not in headers_of(sent[0])
+  assert sent[1]["body"] == BODY
+
+
+def test_encoded_responses_pass_through():
+  encoded = gzip.compress(BODY)
+  sent = run(make_app(start([(b"content-encoding", b"gzip")]), body(encoded)))
+
+  assert headers_of(sent[0])["content-encoding"] == "gzip"
+  assert sent[1]["body"] == encoded
+
+
+def test_streamed_responses_pass_through_in_order():
+  sent = run(make_app(start(), body(BODY, more_body=True), body(BODY, more_body=True), body(b"")))
+
+  assert [message["type"] for message in sent] == ["http.response.start"] + ["http.response.body"] * 3
+  assert "content-encoding" not in headers_of(sent[0])
+  assert b"".join(message["body"] for message in sent[1:]) == BODY * 2
+
+
+def test_other_messages_are_sent_after_start():
+  pathsend = {"type": "http.response.pathsend", "path": "/tmp/page.html"}
+  sent = run(make_app(start(), pathsend))
+
+  assert sent == [start(), pathsend]
@@ -0,0 +1,220 @@
+import sys
+import time
+import types
+from contextlib import contextmanager
+
+import pytest
+
+from app.services import generation_store
+from app.services.generation_store import (
+  PostgresGenerationStore,
+  SqliteGenerationStore,
+  create_generation_store,
+  page_hash,
+)
+
+HOME = "<html><body><h1>Home</h1></body></html>"
+DETAIL = "<html><body><h1>Detail</h1></body></html>"
+
+
+@pytest.fixture
+def store():
+  store = SqliteGenerationStore()
+  yield store
+  store.close()
+
+
+def test_record_and_get_generation(store):
+  generation_id = store.record_generation(
+    prompt="fitness app",
+    platform="mobile",
+    pages=[{"name": "Home", "html": HOME}, {"name": "Detail", "html": DETAIL}],
+    model="gpt-4o",
+    timings={"total_ms": 1200.5},
+    user_id="user-1",
+    conversation_id="conv-1",
+  )
+
+  generation = store.get_generation(generation_id)
+
+  assert generation["id"] == generation_id
+  assert generation["prompt"] == "fitness app"
+  assert generation["platform"] == "mobile"
+  assert generation["model"] == "gpt-4o"
+  assert generation["timings"] == {"total_ms": 1200.5}
+  assert generation["user_id"] == "user-1"
+  assert generation["conversation_id"] == "conv-1"
+  assert [(p["name"], p["html"], p["hash"]) for p in generation["pages"]] == [
+    ("Home", HOME, page_hash(HOME)),
+    ("Detail", DETAIL, page_hash(DETAIL)),
+  ]
+
+
+def test_reused_generation_shares_pages(store):
+  original = store.record_generation("fitness app", "mobile", [{"name": "Home", "html": HOME}], user_id="u1")
+  reused = store.record_generation("fitness tracking app", "mobile", [{"name": "Home", "html": HOME}], user_id="u1", reused_from=original)
+
+  assert store.get_generation(original)["reused_from"] is None
+  assert store.get_generation(reused)["reused_from"] == original
+  assert store.get_generation(reused)["pages"][0]["html"] == HOME
+
+
+def test_get_missing_generation(store):
+  assert store.get_generation("missing") is None
+
+
+def test_identical_pages_are_stored_once(store):
+  store.record_generation("first", "web", [{"name": "Home", "html": HOME}])
+  store.record_generation("second", "web", [{"name": "Home", "html": HOME}, {"name": "Copy", "html": HOME}])
+
+  with store._connect() as conn:
+    blobs = conn.execute("SELECT hash, size, compressed_size FROM page_blobs").fetchall()
+
+  assert len(blobs) == 1
+  assert blobs[0][0] == page_hash(HOME)
+  assert blobs[0][1] == len(HOME)
+
+
+def test_list_generations_filters(store):
+  first = store.record_generation("a", "web", [{"name": "Home", "html": HOME}], user_id="u1", conversation_id="c1")
+  time.sleep(0.01)
+  second = store.record_generation("b", "web", [{"name": "Home", "html": DETAIL}], user_id="u1", conversation_id="c2")
+  time.sleep(0.01)
+  third = store.record_generation("c", "mobile", [{"name": "Home", "html": HOME}], user_id="u2", conversation_id="c1")
+
+  assert [g["id"] for g in store.list_generations()] == [third, second, first]
+  assert [g["id"] for g in store.list_generations(user_id="u1")] == [second, first]
+  assert [g["id"] for g in store.list_generations(conversation_id="c1")] == [third, first]
+  assert [g["id"] for g in store.list_generations(user_id="u1", conversation_id="c1")] == [first]
+  assert [g["id"] for g in store.list_generations(limit=1)] == [third]
+
+  second_created = store.get_generation(second)["created_at"]
+  assert [g["id"] for g in store.list_generations(since=second_created)] == [third, second]
+  assert [g["id"] for g in store.list_generations(until=second_created)] == [first]
+
+
+def test_list_generations_include_html(store):
+  store.record_generation("a", "web", [{"name": "Home", "html": HOME}])
+
+  without_html = store.list_generations()[0]["pages"][0]
+  with_html = store.list_generations(include_html=True)[0]["pages"][0]
+
+  assert "html" not in without_html
+  assert without_html["hash"] == page_hash(HOME)
+  assert with_html["html"] == HOME
+
+
+def test_get_page_html(store):
+  store.record_generation("a", "web", [{"name": "Home", "html": HOME}])
+
+  assert store.get_page_html(page_hash(HOME)) == HOME
+  assert store.get_page_html(page_hash("other")) is None
+
+
+def test_create_sqlite_store_from_url(tmp_path):
+  store = create_generation_store(f"sqlite:///{tmp_path}/archive/generations.db")
+  store.record_generation("a", "web", [{"name": "Home", "html": HOME}])
+
+  assert (tmp_path / "archive" / "generations.db").exists()
+  assert len(store.list_generations()) == 1
+
+
+class FakeOperationalError(Exception):
+  pass
+
+
+class FakeConnection:
+  """Records the SQL a psycopg connection would run."""
+
+  def __init__(self):
+    self.closed = False
+    self.statements = []
+
+  def execute(self, sql, params=None):
+    self.statements.append((sql, params))
+    return self
+
+  def fetchone(self):
+    return None
+
+  def fetchall(self):
+    return []
+
+  @contextmanager
+  def transaction(self):
+    yield
+
+  def close(self):
+    self.closed = True
+
+
+@pytest.fixture
+def psycopg(monkeypatch):
+  module = types.SimpleNamespace(OperationalError=FakeOperationalError, connections=[], connect_calls=[], down=False)
+
+  def connect(dsn, **kwargs):
+    module.connect_calls.append(kwargs)
+    if module.down:
+      raise FakeOperationalError("connection refused")
+    module.connections.append(FakeConnection())
+    return module.connections[-1]
+
+  module.connect = connect
+  monkeypatch.setitem(sys.modules, "psycopg", module)
+  return module
+
+
+def test_postgres_schema_and_placeholders(psycopg):
+  store = PostgresGenerationStore("postgresql://localhost/db")
+  schema = " ".join(sql for sql, _ in psycopg.connections[0].statements)
+
+  assert "data BYTEA NOT NULL" in schema
+  assert "created_at DOUBLE PRECISION NOT NULL" in schema
+  assert "BLOB" not in schema and "REAL" not in schema
+  assert store._sql("SELECT id FROM generations WHERE user_id = ? LIMIT ?") == (
+    "SELECT id FROM generations WHERE user_id = %s LIMIT %s"
+  )
+
+  store.get_page_html("abc")
+
+  assert psycopg.connections[0].statements[-1] == ("SELECT data FROM page_blobs WHERE hash = %s", ("abc",))
+  assert psycopg.connect_calls == [{"autocommit": True, "connect_timeout": generation_store.CONNECT_TIMEOUT_SECONDS}]
+
+
+def test_postgres_waits_before_reconnecting(psycopg):
+  store = PostgresGenerationStore("postgresql://localhost/db")
+  psycopg.connections[0].close()
+  psycopg.down = True
+
+  with pytest.raises(FakeOperationalError):
+    store.get_page_html("abc")
+  with pytest.raises(FakeOperationalError):
+    store.get_page_html("abc")
+
+  # Only the first operation after the outage tries to connect
+  assert len(psycopg.connect_calls) == 2
+
+
+def test_get_generation_store_waits_before_retrying(monkeypatch):
+  attempts = []
+
+  def fail(url):
+    attempts.append(url)
+    raise FakeOperationalError("connection refused")
+
+  monkeypatch.setenv("GENERATION_DB_URL", "postgresql://localhost/db")
+  monkeypatch.setattr(generation_store, "_store", None)
+  monkeypatch.setattr(generation_store, "_store_retry_at", 0.0)
+  monkeypatch.setattr(generation_store, "create_generation_store", fail)
+
+  with pytest.raises(FakeOperationalError):
+    generation_store.get_generation_store()
+  with pytest.raises(RuntimeError):
+    generation_store.get_generation_store()
+  assert len(attempts) == 1
+
+  monkeypatch.setattr(generation_store, "_store_retry_at", 0.0)
+  monkeypatch.setattr(generation_store, "create_generation_store", lambda url: SqliteGenerationStore())
+  store = generation_store.get_generation_store()
+
+  assert generation_store.get_generation_store() is store
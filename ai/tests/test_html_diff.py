@@ -0,0 +1,210 @@
+import html5lib
+import pytest
+
+from app.services.html_diff import apply_patch, canonicalize_html, diff_html, diff_pages, parse_html
+
+PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+  <title>Sign Up</title>
+</head>
+<body>
+  <div class="page">
+    <h1>Sign Up</h1>
+    <form>
+      <input type="email" placeholder="Email">
+      <button class="btn">Create account</button>
+    </form>
+  </div>
+</body>
+</html>
+"""
+
+
+@pytest.mark.parametrize(
+  "old, new",
+  [
+    ("<script>if (a < b && c) { run('<p>'); }</script>", "<script>if (a > b) { run('</div>'); }</script>"),
+    ("<style>p > a { color: red; }</style><p>x</p>", "<style>p > b { color: blue; }</style><p>x</p>"),
+    ("<p>Fish &amp; chips &lt;3</p>", "<p>Fish &amp; chips &copy; &#169; &gt;</p>"),
+    ('<a title="&quot;a&quot; &amp; b">x</a>', '<a title="a &lt; b">x</a>'),
+    ("<p>a<br>b<img src=x.png></p>", "<p>a<br/>b<img src='y.png' /><hr/></p>"),
+    ('<div/>x<span/>y', '<div>x<span>z</span></div>'),
+    ('<svg><path d="M0"/><circle r="1"/></svg>', '<svg><circle r="2"/></svg>'),
+    ("<ul><li>One<li>Two<li>Three</ul>", "<ul><li>One<li>2<li>Three<li>Four</ul>"),
+    ("", "<p>Hello</p>"),
+    ("<p>Hello</p>", ""),
+    ("", ""),
+    ('<input type="text" name="a" required>', '<input required name="b" type="text">'),
+    ('<div id="x" class="a" data-v="1"></div>', '<div data-v="1" id="x" class="b" title="t"></div>'),
+    (PAGE, PAGE.replace("Create account", "Register").replace('class="page"', 'class="page wide"')),
+    (PAGE, PAGE.replace("<h1>Sign Up</h1>", "<h1>Sign Up</h1>\n    <p>It's free.</p>")),
+    (PAGE, PAGE.replace('<html lang="en">', '<html lang="de">').replace("<body>", '<body class="dark">')),
+    (PAGE, PAGE.replace("<title>Sign Up</title>", "<title>Register</title><meta charset=utf-8>")),
+  ],
+)
+def test_patch_reproduces_new_html(old: str, new: str):
+  assert apply_patch(old, diff_html(old, new)) == canonicalize_html(new)
+  assert apply_patch(new, diff_html(new, old)) == canonicalize_html(old)
+
+
+def test_identical_documents_have_empty_patch():
+  assert diff_html(PAGE, PAGE) == []
+  assert diff_html("<p>a&amp;b</p>", "<p>a&#38;b</p>") == []
+
+
+def test_paths_follow_browser_tree():
+  # Whitespace before <head> is dropped, <tbody> is implied
+  html = "<!DOCTYPE html>\n<html>\n<head>\n<title>A</title>\n</head>\n<body><table><tr><td>1</td></tr></table></body>\n</html>\n"
+
+  document = parse_html(html)
+  assert [node.kind for node in document.childNodes] == ["doctype", "element"]
+  assert [node.name for node in document.childNodes[1].childNodes if node.kind == "element"] == ["head", "body"]
+
+  ops = diff_html(html, html.replace("<td>1</td>", "<td>2</td>").replace(">A<", ">B<"))
+
+  assert ops == [
+    {"op": "text", "path": [1, 2, 0, 0, 0, 0, 0], "text": "2"},
+    {"op": "text", "path": [1, 0, 1, 0], "text": "B"},
+  ]
+
+
+def test_implied_head_and_body():
+  document = parse_html("<title>A</title><p>x")
+
+  html = document.childNodes[0]
+  assert [node.name for node in html.childNodes] == ["head", "body"]
+  assert html.childNodes[0].childNodes[0].name == "title"
+  assert html.childNodes[1].childNodes[0].name == "p"
+
+
+def parse_dom(html):
+  # Independent DOM, as a browser builds it (pages run with scripts enabled)
+  document = html5lib.parse(html, treebuilder="dom", namespaceHTMLElements=False, scripting=True)
+  document.normalize()
+  return document
+
+
+def dom_tree(node):
+  if node.nodeType == node.TEXT_NODE:
+    return ("#text", node.data)
+  if node.nodeType == node.COMMENT_NODE:
+    return ("#comment", node.data)
+  if node.nodeType == node.DOCUMENT_TYPE_NODE:
+    return ("#doctype", node.name)
+  attributes = list(node.attributes.items()) if node.nodeType == node.ELEMENT_NODE else []
+  return (node.nodeName, attributes, [dom_tree(child) for child in node.childNodes])
+
+
+def apply_to_dom(html, ops):
+  """Apply a patch to the DOM of a page like a client would (fragments parsed in context)."""
+  document = parse_dom(html)
+  for op in ops:
+    *parent_path, index = op["path"]
+    parent = document
+    for step in parent_path:
+      parent = parent.childNodes[step]
+    if op["op"] in ("insert", "replace"):
+      if "text" in op:
+        node = document.createTextNode(op["text"])
+      elif parent is document:
+        [node] = [child for child in parse_dom(op["html"]).childNodes if child.nodeType != child.ELEMENT_NODE]
+      else:
+        fragment = html5lib.parseFragment(
+          op["html"], container=parent.tagName, treebuilder="dom", namespaceHTMLElements=False, scripting=True
+        )
+        fragment.normalize()
+        [node] = fragment.childNodes
+      if op["op"] == "replace":
+        parent.replaceChild(node, parent.childNodes[index])
+      elif index < len(parent.childNodes):
+        parent.insertBefore(node, parent.childNodes[index])
+      else:
+        parent.appendChild(node)
+    elif op["op"] == "remove":
+      parent.removeChild(parent.childNodes[index])
+    elif op["op"] == "text":
+      parent.childNodes[index].data = op["text"]
+    elif op["op"] == "attrs":
+      element = parent.childNodes[index]
+      for name in op["remove"]:
+        element.removeAttribute(name)
+      for name, value in op["set"].items():
+        element.setAttribute(name, value)
+  return dom_tree(document)
+
+
+@pytest.mark.parametrize(
+  "old, new",
+  [
+    # Nested links are split by the adoption agency algorithm
+    ('<a class="card">Card <a href="/buy">Buy</a></a><button>Save</button>', None),
+    # <div> closes the <p>, and </p> then opens an empty one
+    ("<p>Intro<div>Body</div></p><p>Save</p>", None),
+    ("<h1>a<h2>b</h2><p>Save</p>", None),
+    ("<textarea><b>Save</b></textarea><p>Save</p>", None),
+    ("<title><b>Save</b></title><p>Save</p>", None),
+    ("<head><noscript><style>p{}</style></noscript></head><p>Save</p>", None),
+    ('<table><col width="1"><tr><td>Save</td></tr></table>', None),
+    ('<image src="a.png"><p>Save</p>', None),
+    ("<p><b>a<i>Save</b>c</i></p>", None),
+    ("<table><tr><td>Save</td></tr><p>Fostered</p></table>", None),
+    ("<select><option>Save<option>b</select><ul><li>Save<li>x</ul>", None),
+    ("<pre>\n\nSave</pre>", None),
+    ("<!DOCTYPE html>\n<html>\n<body>\n  <form><form><p>Save</p></form>\n</body>\n</html>\n<!--x-->", None),
+    (PAGE, PAGE.replace("</form>", "</form>\n    <p>Have an account? <a href=/login>Log in</a></p>")),
+    (PAGE, PAGE.replace('<input type="email" placeholder="Email">\n', "")),
+    (PAGE, PAGE.replace('class="page"', 'data-x="1" class="page"')),
+  ],
+)
+def test_paths_match_html5_dom(old: str, new: str):
+  new = new if new is not None else old.replace("Save", "Submit")
+  ops = diff_html(old, new)
+
+  assert ops
+  assert apply_to_dom(old, ops) == dom_tree(parse_dom(new))
+
+
+def test_text_changes_are_decoded():
+  ops = diff_html("<p>a</p>", "<p>a &amp; b</p>")
+
+  assert ops == [{"op": "text", "path": [0, 1, 0, 0], "text": "a & b"}]
+
+
+def test_diff_pages_returns_patch_for_small_changes():
+  previous = [{"name": "Sign Up", "html": PAGE}]
+  pages = [{"name": "Sign Up", "html": PAGE.replace("Create account", "Register")}]
+
+  [page] = diff_pages(previous, pages)
+
+  assert page["name"] == "Sign Up"
+  assert "html" not in page
+  assert apply_patch(PAGE, page["patch"]) == canonicalize_html(pages[0]["html"])
+
+
+def test_diff_pages_returns_html_for_new_or_rewritten_pages():
+  previous = [{"name": "Sign Up", "html": PAGE}]
+  pages = [
+    {"name": "Sign Up", "html": "<main><h2>Completely different</h2></main>"},
+    {"name": "Login", "html": "<p>Login</p>"},
+  ]
+
+  assert diff_pages(previous, pages) == pages
+
+
+def test_diff_pages_returns_empty_patch_for_unchanged_page():
+  previous = [{"name": "Sign Up", "html": PAGE}, {"name": "Login", "html": "<p>Login</p>"}]
+  pages = [{"name": "Login", "html": "<p>Login</p>"}, {"name": "Sign Up", "html": PAGE}]
+
+  assert diff_pages(previous, pages) == [{"name": "Login", "patch": []}, {"name": "Sign Up", "patch": []}]
+
+
+def test_diff_pages_returns_html_when_markup_does_not_parse_back():
+  # Foster parenting nests the second link inside the first, which markup cannot express
+  new_html = PAGE.replace("<h1>Sign Up</h1>", "<h1>Sign Up</h1><a href=/a><table><a href=/b>Buy</table></a>")
+
+  with pytest.raises(ValueError):
+    diff_html(PAGE, new_html)
+  assert diff_pages([{"name": "Sign Up", "html": PAGE}], [{"name": "Sign Up", "html": new_html}]) == [
+    {"name": "Sign Up", "html": new_html}
+  ]
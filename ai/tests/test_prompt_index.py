@@ -0,0 +1,92 @@
+from app.services.generation_store import SqliteGenerationStore
+from app.services.prompt_index import PromptIndex
+
+
+def ready_index(shared: bool = False) -> PromptIndex:
+  index = PromptIndex(shared=shared)
+  index.ready.set()
+  return index
+
+
+def test_matches_paraphrased_prompt():
+  index = ready_index()
+  index.add("fitness tracking mobile app", "mobile", "gen-1", user_id="u1")
+
+  match = index.lookup("mobile app for tracking fitness", "mobile", 0.6, user_id="u1")
+
+  assert match.generation_id == "gen-1"
+  assert match.similarity == 1.0
+
+
+def test_unrelated_prompt_misses():
+  index = ready_index()
+  index.add("fitness tracking mobile app", "mobile", "gen-1", user_id="u1")
+
+  assert index.lookup("recipe sharing website", "mobile", 0.6, user_id="u1") is None
+
+
+def test_matches_are_scoped_by_user_and_platform():
+  index = ready_index()
+  index.add("fitness tracking mobile app", "mobile", "gen-1", user_id="u1")
+
+  assert index.lookup("fitness tracking mobile app", "mobile", 0.6, user_id="u2") is None
+  assert index.lookup("fitness tracking mobile app", "web", 0.6, user_id="u1") is None
+  assert index.lookup("fitness tracking mobile app", "mobile", 0.6) is None
+
+
+def test_shared_index_matches_across_users():
+  index = ready_index(shared=True)
+  index.add("fitness tracking mobile app", "mobile", "gen-1", user_id="u1")
+
+  assert index.lookup("fitness tracking mobile app", "mobile", 0.6, user_id="u2").generation_id == "gen-1"
+
+
+def test_lookups_miss_until_loaded():
+  store = SqliteGenerationStore()
+  store.record_generation("fitness tracking mobile app", "mobile", [{"name": "Home", "html": "<p>x</p>"}], user_id="u1")
+  store.record_generation("make it blue", "mobile", [{"name": "Home", "html": "<p>y</p>"}], user_id="u1", iteration=True)
+  index = PromptIndex()
+
+  assert index.lookup("fitness tracking mobile app", "mobile", 0.6, user_id="u1") is None
+  index.load(store, max_entries=100)
+
+  assert len(index) == 1
+  assert index.lookup("fitness tracking mobile app", "mobile", 0.6, user_id="u1") is not None
+
+
+def test_stats_report_reuse_and_reference_hits():
+  index = ready_index()
+  index.lookup("fitness tracking mobile app", "mobile", 0.6, user_id="u1")
+  index.record_hit(reused=True)
+  index.lookup("fitness tracking mobile app", "mobile", 0.6, user_id="u1")
+  index.record_hit(reused=False)
+  index.lookup("fitness tracking mobile app", "mobile", 0.6, user_id="u1")
+
+  stats = index.stats()
+
+  assert stats["lookups"] == 3
+  assert stats["reuse_hits"] == 1
+  assert stats["reference_hits"] == 1
+  assert stats["reuse_hit_rate"] == 1 / 3
+
+
+def test_only_lookups_that_can_match_are_counted():
+  index = PromptIndex()
+  index.lookup("fitness tracking mobile app", "mobile", 0.6, user_id="u1")  # Not loaded yet
+  index.ready.set()
+  index.lookup("fitness tracking mobile app", "mobile", 0.6)  # Anonymous
+  index.lookup("the app", "mobile", 0.6, user_id="u1")  # Only stopwords
+
+  assert index.stats()["lookups"] == 0
+
+  index.lookup("fitness tracking mobile app", "mobile", 0.6, user_id="u1")
+
+  assert index.stats()["lookups"] == 1
+
+
+def test_prefers_newest_of_identical_prompts():
+  index = ready_index()
+  for number in range(3):
+    index.add("fitness tracking mobile app", "mobile", f"gen-{number}", user_id="u1")
+
+  assert index.lookup("fitness tracking mobile app", "mobile", 0.6, user_id="u1").generation_id == "gen-2"